@@ -1,27 +1,30 @@
 import argparse
+from collections import defaultdict, deque
 import csv
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass, fields
 from datetime import datetime
 from enum import StrEnum
+from functools import lru_cache
+import mmap
+from operator import attrgetter
+import os
 from pathlib import Path
 import re
-from statistics import mean
-from typing import Optional
+import shutil
+import tempfile
+from typing import ClassVar, Iterable, Iterator, Optional, Sequence
 
-from rich import box, print
-from rich.console import Console
-from rich.prompt import Confirm
-from rich.table import Table
+from rich import print
 
 DIR = Path(__file__).parent.resolve()
 DB_PATH = DIR / "books.csv"
-
-console = Console()
+BUFFER_SIZE = 1 << 20  # 1 MiB buffers for csv reads and rewrites
+DATE_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}\Z")
 
 
 class DateAction(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
-        if not re.match("[0-9]{4}-[0-9]{2}-[0-9]{2}", values):
+        if not DATE_RE.match(values):
             raise argparse.ArgumentError(self, "Dates must be formatted 'YYYY-MM-DD'")
         setattr(namespace, self.dest, values)
 
@@ -42,13 +45,25 @@ class MonthAction(argparse.Action):
         setattr(namespace, self.dest, values)
 
 
+@lru_cache(maxsize=1024)
+def parse_date(value: str) -> datetime:
+    """
+    Parse a 'YYYY-MM-DD' date once per distinct value; many books share dates
+    """
+    return datetime.fromisoformat(value)
+
+
 class Status(StrEnum):
     TBR = "TBR"
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
 
 
-@dataclass
+# Plain dict, cheaper to index per row than the Status.__members__ mappingproxy
+STATUS_BY_NAME = {status.name: status for status in Status}
+
+
+@dataclass(slots=True)
 class Book:
     id: str | None = None
     title: str = ""
@@ -57,24 +72,50 @@ class Book:
     date_started: str | None = None
     date_completed: str | None = None
     days_to_read: int | None = None
+    # Next id to hand out, read lazily from the csv by the first Book without one
+    _next_id: ClassVar[int | None] = None
 
     def __post_init__(self):
         if not self.id:
-            books = read_books()
-            if books:
-                last_book_id = int(books[-1].id)
-                self.id = str(last_book_id + 1)
-            else:
-                self.id = "1"
+            if Book._next_id is None:
+                Book._next_id = last_book_id(Path(DB_PATH)) + 1
+            self.id = str(Book._next_id)
+            Book._next_id += 1
 
         if self.date_started and self.date_completed:
-            ds = datetime.fromisoformat(self.date_started)
-            dc = datetime.fromisoformat(self.date_completed)
+            ds = parse_date(self.date_started)
+            dc = parse_date(self.date_completed)
             self.days_to_read = (dc - ds).days + 1  # inclusive
         else:
             self.days_to_read = None
 
 
+def completed_ymd(books: Iterable[Book]) -> list[tuple[int, int, int]]:
+    """
+    (year, month, days_to_read) of each book with both dates set, for BookStats
+    or any other aggregation over finished books; days_to_read is only set once
+    date_completed has parsed, so year and month are sliced from the string
+    """
+    return [
+        (int(dc[0:4]), int(dc[5:7]), book.days_to_read)
+        for book in books
+        if book.days_to_read and (dc := book.date_completed) and len(dc) == 10
+    ]
+
+
+# rich column styles, in column order
+BOOK_COLORS = (
+    "white",
+    "bright_green",
+    "bright_blue",
+    "bright_red",
+    "bright_magenta",
+    "cyan3",
+    "orange1",
+)
+STATS_COLORS = ("bright_green", "bright_blue", "bright_red", "cyan3")
+
+
 class BookStats:
     """
     Class to generate stats for books read, based on date_completed
@@ -82,62 +123,45 @@ class BookStats:
 
     def __init__(self, books: list[Book]):
         self.books = books
-        self.ymd = [self.get_ymd(book) for book in books]
-
-    def get_ymd(self, book: Book) -> Optional[tuple[int, int, int]]:
-        if book.days_to_read and book.date_completed:
-            ymd = datetime.fromisoformat(book.date_completed)
-            return (
-                ymd.year,
-                ymd.month,
-                book.days_to_read,
-            )
-        return None
+        self.ymd = completed_ymd(books)
+        # days_to_read of each completed book, bucketed by (year, month) in one pass
+        self.days_by_month: defaultdict[tuple[int, int], list[int]] = defaultdict(list)
+        for year, month, days in self.ymd:
+            self.days_by_month[(year, month)].append(days)
+
+    def summarize(self, days: list[int]) -> tuple[int, float | None]:
+        count = len(days)
+        if count:
+            return count, round(sum(days) / count, 2)
+        return count, None
 
-    def flatten(self, lst: list) -> list:
-        out = []
-        for item in lst:
-            if isinstance(item, list):
-                out.extend(self.flatten(item))
-            else:
-                out.append(item)
-        return out
+    def month_row(self, year: int, month: int) -> dict:
+        count, avg_days_to_read = self.summarize(
+            self.days_by_month.get((year, month), [])
+        )
+        return {
+            "year": year,
+            "month": month,
+            "count": count,
+            "avg_days_to_read": avg_days_to_read,
+        }
 
     def detailed_stats(self) -> list[dict]:
-        years = {book[0] for book in self.ymd if book}
-        stats = [
-            [self.month_stats(year, month) for month in range(1, 13)] for year in years
-        ]
-        return self.flatten(stats)
+        years = sorted({year for year, _ in self.days_by_month})
+        return [self.month_row(year, month) for year in years for month in range(1, 13)]
 
     def month_stats(self, year: int, month: int) -> list[dict]:
-        books_read = [
-            book for book in self.ymd if book and book[0] == year and book[1] == month
-        ]
-        count = len(books_read)
-        if count:
-            avg_days_to_read = round(mean([book[2] for book in books_read]), 2)
-        else:
-            avg_days_to_read = None
-        return [
-            {
-                "year": year,
-                "month": month,
-                "count": count,
-                "avg_days_to_read": avg_days_to_read,
-            }
-        ]
+        return [self.month_row(year, month)]
 
     def year_stats(self, year: int, detailed: bool = False) -> list[dict]:
-        books_read = [book for book in self.ymd if book and book[0] == year]
-        count = len(books_read)
-        if count:
-            avg_days_to_read = round(mean([book[2] for book in books_read]), 2)
-        else:
-            avg_days_to_read = None
         if detailed:
-            month_stats = [self.month_stats(year, month) for month in range(1, 13)]
-            return self.flatten(month_stats)
+            return [self.month_row(year, month) for month in range(1, 13)]
+        days = [
+            day
+            for month in range(1, 13)
+            for day in self.days_by_month.get((year, month), [])
+        ]
+        count, avg_days_to_read = self.summarize(days)
         return [
             {
                 "year": year,
@@ -147,93 +171,216 @@ class BookStats:
         ]
 
     def print_rich_table(self, stats: list[dict[str, int | float | None]]):
+        from rich import box
+        from rich.table import Table
+
         columns = stats[0].keys()
-        colors = ["bright_green", "bright_blue", "bright_red", "cyan3"]
         table = Table(title="BookTracker Statistics", box=box.ROUNDED)
-        for column, color in zip(columns, colors):
+        for column, color in zip(columns, STATS_COLORS):
             table.add_column(column, style=color, justify="full", min_width=8)
         for row in stats:
             values = list(map(str, row.values()))
             table.add_row(*values)
-        console.print(table)
+        print(table)
+
+
+BOOK_FIELDS = tuple(f.name for f in fields(Book))
+# Fields stored in the csv, in column order (days_to_read is derived)
+PERSIST_FIELDS = tuple(name for name in BOOK_FIELDS if name != "days_to_read")
+# C-level field tuples: book_values for table rows, book_row for csv rows
+book_values = attrgetter(*BOOK_FIELDS)
+book_row = attrgetter(*PERSIST_FIELDS)
 
 
 def write_book(book: Book) -> None:
     path = Path(DB_PATH)
-    book_dict = asdict(book)
-    del book_dict["days_to_read"]  # Do not store this field
+    row = book_row(book)
     if path.is_file():
-        with open(path, "a", newline="\n") as f:
+        with open(path, "a", newline="", buffering=BUFFER_SIZE) as f:
             writer = csv.writer(f)
-            writer.writerow(book_dict.values())
+            writer.writerow(row)
     else:
-        with open(path, "w", newline="\n") as f:
-            fieldnames = list(book_dict.keys())
+        with open(path, "w", newline="", buffering=BUFFER_SIZE) as f:
             writer = csv.writer(f)
-            writer.writerow(fieldnames)
-            writer.writerow(book_dict)
+            writer.writerow(PERSIST_FIELDS)
+            writer.writerow(row)
+    Book._next_id = None  # Re-read from the new last line on the next new Book
     print(f"Added {book.title} by {book.author} to book_db.csv")
 
 
 def read_books(path: Path = Path(DB_PATH)) -> list[Book]:
     if path.is_file():
-        with open(path, "r") as f:
-            reader = csv.DictReader(f)
-            return [
-                Book(
-                    id=row["id"],
-                    title=row["title"],
-                    author=row["author"],
-                    status=Status[row["status"]],
-                    date_started=row["date_started"],
-                    date_completed=row["date_completed"],
-                )
-                for row in reader
-            ]
+        stat = path.stat()
+        return list(_read_books_cached(path, stat.st_mtime_ns, stat.st_size))
     return []
 
 
-def filter_books(field: str | None = None, value: str | None = None) -> list[Book]:
-    books = read_books()
+@lru_cache(maxsize=4)
+def _read_books_cached(path: Path, mtime_ns: int, size: int) -> tuple[Book, ...]:
+    """
+    Parse the csv once per (path, mtime, size); any write to the file changes
+    the key, so the next read_books() call re-parses it
+    """
+    with open(path, "r", buffering=BUFFER_SIZE) as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Skip header
+        return tuple(books_from_rows(reader))
+
+
+def read_rows(path: Path = Path(DB_PATH)) -> Iterator[list[str]]:
+    """
+    Yield the raw csv rows (without the header) one at a time, bypassing the cache
+    """
+    if path.is_file():
+        with open(path, "r", newline="", buffering=BUFFER_SIZE) as f:
+            reader = csv.reader(f)
+            next(reader, None)  # Skip header
+            for row in reader:
+                yield row[: len(PERSIST_FIELDS)]
+
+
+def read_books_iter(path: Path = Path(DB_PATH)) -> Iterator[Book]:
+    """
+    Yield books one at a time straight from the csv, bypassing the cache
+    """
+    yield from books_from_rows(read_rows(path))
+
+
+def books_from_rows(rows: Iterable[list[str]]) -> Iterator[Book]:
+    # Bind the per-row lookups locally rather than resolving globals every row
+    new_book, statuses = Book, STATUS_BY_NAME
+    return (
+        new_book(id, title, author, statuses[status], date_started, date_completed)
+        for id, title, author, status, date_started, date_completed, *_ in rows
+    )
+
+
+def scan_books(value: str, path: Path = Path(DB_PATH)) -> Sequence[Book]:
+    """
+    Memory-map the csv and only parse the lines whose raw bytes contain value
+    (ignoring ASCII case), skipping the rest of the file unparsed. Non-ASCII
+    lines are always kept, since their casefolded text may still match (e.g.
+    'strasse' in 'Straße'); filter_books does the casefold check. Falls back to
+    read_books when raw lines can't stand in for records: a '"' is stored
+    doubled, and a quoted newline splits one record over several lines
+    """
+    if not path.is_file() or not path.stat().st_size:
+        return ()
+    if '"' in value:
+        return read_books(path)
+    needle = value.lower().encode()
+    in_quotes = False
+    lines = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mm.readline()  # Skip header
+        for line in iter(mm.readline, b""):
+            # An odd number of quotes leaves the line ending inside a quoted field
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                return read_books(path)
+            if needle in line.lower() or not line.isascii():
+                lines.append(line.decode())
+    return tuple(books_from_rows(csv.reader(lines)))
+
+
+def last_book_id(path: Path = Path(DB_PATH)) -> int:
+    """
+    Return the id of the last book in the csv by reading backwards from the end
+    of the file, rather than parsing every row
+    """
+    if not path.is_file():
+        return 0
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            step = min(1024, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            if b"\n" in tail.rstrip(b"\r\n"):
+                break
+    last_line = tail.rstrip(b"\r\n").rsplit(b"\n", 1)[-1]
+    if last_line.count(b'"') % 2:
+        # An unpaired quote closes a field opened on an earlier line, so the last
+        # record spans lines; parse the file rather than guess where it starts
+        last_row = deque(read_rows(path), maxlen=1)
+        last_id = last_row[0][0] if last_row else ""
+    else:
+        last_id = last_line.split(b",", 1)[0].decode()
+    return int(last_id) if last_id.isdigit() else 0
+
+
+def filter_books(
+    field: str | None = None, value: str | None = None, path: Path = Path(DB_PATH)
+) -> list[Book]:
     if field and value:
-        return [b for b in books if value.lower() in str(getattr(b, field).lower())]
-    return books
+        # bytes.lower() only folds ASCII, so only prefilter raw lines for ASCII values
+        books = scan_books(value, path) if value.isascii() else read_books(path)
+        needle = value.casefold()
+        return [b for b in books if needle in str(getattr(b, field)).casefold()]
+    return read_books(path)
+
+
+def filter_books_by_id(id: str, path: Path = Path(DB_PATH)) -> Optional[Book]:
+    """
+    Return the book whose id is exactly id, stopping at the first matching row
+    and only parsing that row into a Book
+    """
+    rows = (row for row in read_rows(path) if row[0] == id)
+    return next(books_from_rows(rows), None)
 
 
 def get_book_by_id(id: str) -> Optional[Book]:
-    book = filter_books(field="id", value=id)
+    book = filter_books_by_id(id)
     if book:
-        return book[0]
+        return book
     else:
         print(f"There is no book with {id=}")
         return None
 
 
-def write_books(books: list[dict]) -> None:
-    with open(DB_PATH, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(list(books[0].keys()))
-        for book in books:
-            writer.writerow(list(book.values()))
+def write_books(rows: Iterable[Sequence], path: Path = Path(DB_PATH)) -> None:
+    """
+    Rewrite the csv from an iterable of rows. Rows are streamed into a temporary
+    file next to the csv, which then replaces it, so the rows may be generated
+    lazily from the file being replaced
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".csv")
+    try:
+        with open(fd, "w", newline="", buffering=BUFFER_SIZE) as f:
+            writer = csv.writer(f)
+            writer.writerow(PERSIST_FIELDS)
+            writer.writerows(rows)
+        if path.is_file():
+            # mkstemp creates the file 0600; keep the csv's own permissions
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    Book._next_id = None
 
 
 def edit_book(id: str) -> None:
     book = get_book_by_id(id)
     if book:
-        book_dict = asdict(book)
-        del book_dict["days_to_read"]
-        for k, v in book_dict.items():
+        edited_row = list(book_row(book))
+        changed = False
+        for i, (k, v) in enumerate(zip(PERSIST_FIELDS, edited_row)):
             data = input(f"Edit {k} ({v}): ")
-            if data:
-                book_dict[k] = data
-            else:
-                book_dict[k] = v
-        books = [asdict(b) for b in read_books() if b.id != id]
-        books.append(book_dict)
-        write_books(books)
+            if data and data != v:
+                edited_row[i] = data
+                changed = True
+        if not changed:
+            return  # Nothing to write, leave the csv untouched
+        write_books(edited_row if row[0] == id else row for row in read_rows())
 
 
 def delete_book(id: str) -> None:
+    from rich.prompt import Confirm
+
     book = get_book_by_id(id)
     if book:
         title = f"[bright_green]{book.title}[/bright_green]"
@@ -242,8 +389,7 @@ def delete_book(id: str) -> None:
             f"Are you sure you want to delete {title} by {author}? (y/n): "
         )
         if query:
-            books = [asdict(b) for b in read_books() if b.id != id]
-            write_books(books)
+            write_books(row for row in read_rows() if row[0] != id)
             print(f"Deleting {title} by {author}")
 
 
@@ -332,23 +478,17 @@ def main():
         else:
             books = read_books()
         if books:
-            columns = asdict(books[0]).keys()
-            colors = [
-                "white",
-                "bright_green",
-                "bright_blue",
-                "bright_red",
-                "bright_magenta",
-                "cyan3",
-                "orange1",
-            ]
-            rows = [map(str, asdict(book).values()) for book in books]
+            from rich import box
+            from rich.table import Table
+
+            columns = BOOK_FIELDS
+            rows = [map(str, book_values(book)) for book in books]
             table = Table(title="BookTracker", box=box.ROUNDED)
-            for column, color in zip(columns, colors):
+            for column, color in zip(columns, BOOK_COLORS):
                 table.add_column(column, style=color)
             for row in rows:
                 table.add_row(*row)
-            console.print(table)
+            print(table)
         else:
             print("There are no books available with that search criteria.")
     elif args.command == "edit":
@@ -1,7 +1,18 @@
 from pathlib import Path
 import pytest
 
-from ..src.main import Book
+from ..src import main
+from ..src.main import (
+    Book,
+    BookStats,
+    filter_books,
+    filter_books_by_id,
+    last_book_id,
+    read_books,
+    read_books_iter,
+    write_book,
+    write_books,
+)
 
 DB_PATH = Path(__file__).parent.resolve() / "testdata.csv"
 
@@ -19,3 +30,152 @@ def test_book_days_to_read(date_completed, expected):
         date_completed=date_completed,
     )
     assert book.days_to_read == expected
+
+
+def test_new_book_ids_increment():
+    first, second = Book(title="FIRST"), Book(title="SECOND")
+    assert int(second.id) == int(first.id) + 1
+    assert Book(id="7").id == "7"
+
+
+def test_last_book_id(tmp_path):
+    path = tmp_path / "books.csv"
+    assert last_book_id(path) == 0
+    path.write_text("id,title,author,status,date_started,date_completed\n")
+    assert last_book_id(path) == 0
+    with open(path, "a") as f:
+        f.write("1,TITLE,AUTHOR,TBR,,\n")
+        f.write('12,"A, LONG TITLE",AUTHOR,TBR,,\n')
+    assert last_book_id(path) == 12
+
+
+def test_last_book_id_multiline_record(tmp_path):
+    path = tmp_path / "books.csv"
+    write_books(
+        [
+            ("1", "TITLE", "AUTHOR", "TBR", "", ""),
+            ("2", "Vol\n3,part", "AUTHOR", "TBR", "", ""),
+        ],
+        path,
+    )
+    assert last_book_id(path) == 2
+    write_books([("4", 'Said "Hi"\nThere', "AUTHOR", "TBR", "", "")], path)
+    assert last_book_id(path) == 4
+
+
+def test_read_books_cache_invalidated_on_write(tmp_path):
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "id,title,author,status,date_started,date_completed\n1,TITLE,AUTHOR,TBR,,\n"
+    )
+    assert [b.title for b in read_books(path)] == ["TITLE"]
+    assert read_books(path) == read_books(path)
+    with open(path, "a") as f:
+        f.write("2,OTHER,AUTHOR,TBR,,\n")
+    assert [b.title for b in read_books(path)] == ["TITLE", "OTHER"]
+
+
+def test_book_stats():
+    books = [
+        Book(id="1", date_started="2024-01-01", date_completed="2024-01-10"),
+        Book(id="2", date_started="2024-01-05", date_completed="2024-01-08"),
+        Book(id="3", date_started="2024-02-01", date_completed="2024-03-01"),
+        Book(id="4", date_started="2025-06-01"),
+    ]
+    stats = BookStats(books)
+    assert stats.month_stats(2024, 1) == [
+        {"year": 2024, "month": 1, "count": 2, "avg_days_to_read": 7}
+    ]
+    assert stats.month_stats(2024, 2)[0]["count"] == 0
+    assert stats.year_stats(2024) == [
+        {"year": 2024, "count": 3, "avg_days_to_read": 14.67}
+    ]
+    assert stats.year_stats(2025) == [
+        {"year": 2025, "count": 0, "avg_days_to_read": None}
+    ]
+    detailed = stats.detailed_stats()
+    assert len(detailed) == 12
+    assert [row["count"] for row in detailed][:3] == [2, 0, 1]
+    assert stats.year_stats(2024, detailed=True) == detailed
+
+
+def test_filter_books(tmp_path):
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "id,title,author,status,date_started,date_completed\n"
+        "1,Dune,\"Herbert, Frank\",COMPLETED,2024-01-01,2024-01-10\n"
+        "2,Emma,\"Austen, Jane\",TBR,,\n"
+        "3,Émile,\"Rousseau, Jean-Jacques\",TBR,,\n"
+        "4,Die Straße,AUTHOR,TBR,,\n"
+    )
+    assert [b.id for b in filter_books("title", "DUNE", path)] == ["1"]
+    assert [b.id for b in filter_books("author", "herbert", path)] == ["1"]
+    assert [b.id for b in filter_books("status", "tbr", path)] == ["2", "3", "4"]
+    assert [b.id for b in filter_books("title", "title", path)] == []
+    assert [b.id for b in filter_books("title", "émile", path)] == ["3"]
+    assert [b.id for b in filter_books("title", "strasse", path)] == ["4"]
+    assert len(filter_books(path=path)) == 4
+
+
+def test_filter_books_quoted_values(tmp_path):
+    path = tmp_path / "books.csv"
+    write_books(
+        [
+            ("1", 'Said "Hi"', "AUTHOR", "TBR", "", ""),
+            ("2", "Line\nBreak", "AUTHOR", "TBR", "", ""),
+        ],
+        path,
+    )
+    assert [b.id for b in filter_books("title", 'said "hi', path)] == ["1"]
+    assert [b.id for b in filter_books("title", "break", path)] == ["2"]
+    assert [b.id for b in filter_books("title", "line", path)] == ["2"]
+
+
+def test_filter_books_by_id(tmp_path):
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "id,title,author,status,date_started,date_completed\n"
+        "1,Dune,\"Herbert, Frank\",COMPLETED,2024-01-01,2024-01-10\n"
+        "10,Emma,\"Austen, Jane\",TBR,,\n"
+    )
+    assert filter_books_by_id("10", path).title == "Emma"
+    assert filter_books_by_id("1", path).title == "Dune"
+    assert filter_books_by_id("0", path) is None
+
+
+def test_write_books_streams_from_same_file(tmp_path):
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "id,title,author,status,date_started,date_completed\n"
+        "1,TITLE,AUTHOR,TBR,,\n"
+        "2,OTHER,AUTHOR,TBR,,\n"
+    )
+    rows = (
+        (b.id, b.title.lower(), b.author, b.status, "", "")
+        for b in read_books_iter(path)
+    )
+    write_books(rows, path)
+    assert [b.title for b in read_books(path)] == ["title", "other"]
+    write_books([], path)
+    assert read_books(path) == []
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_write_books_keeps_file_mode(tmp_path):
+    path = tmp_path / "books.csv"
+    path.write_text("id,title,author,status,date_started,date_completed\n")
+    path.chmod(0o644)
+    write_books([("1", "TITLE", "AUTHOR", "TBR", "", "")], path)
+    assert path.stat().st_mode & 0o777 == 0o644
+
+
+def test_next_id_invalidated_on_write(tmp_path, monkeypatch):
+    path = tmp_path / "books.csv"
+    monkeypatch.setattr(main, "DB_PATH", path)
+    write_books([("5", "TITLE", "AUTHOR", "TBR", "", "")], path)
+    book = Book(title="NEW")
+    assert book.id == "6"
+    write_book(book)
+    assert Book(title="NEXT").id == "7"
+    write_books([], path)
+    assert Book(title="FIRST").id == "1"
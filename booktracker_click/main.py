@@ -1,11 +1,16 @@
-from dataclasses import asdict, dataclass
-from datetime import datetime
+import atexit
+import csv
+from dataclasses import dataclass, fields
+from datetime import date
 from enum import StrEnum
+from functools import cache
+from itertools import batched, chain
+from operator import attrgetter
 from pathlib import Path
-import re
+import signal
 import sqlite3
-from statistics import mean
-from typing import Optional
+import sys
+from typing import Iterable, Iterator, Optional
 
 import click
 from rich import box, print
@@ -16,17 +21,16 @@ from rich.table import Table
 console = Console()
 
 
-def dict_factory(cursor, row):
-    fields = [column[0] for column in cursor.description]
-    return {k: v for k, v in zip(fields, row)}
-
-
 DB_PATH = Path(__file__).parent.resolve() / "books.db"
-CONN = sqlite3.connect(DB_PATH)
-CONN.row_factory = dict_factory
-
-CONN.execute(
-    """
+# Per-connection settings; journal_mode=WAL persists in the file (see configure)
+PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA busy_timeout=5000;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+"""
+CREATE_DB = """
     CREATE TABLE IF NOT EXISTS books(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         title TEXT,
@@ -34,9 +38,52 @@ CONN.execute(
         status TEXT,
         date_started TEXT,
         date_completed TEXT
-    )
+    );
+    CREATE INDEX IF NOT EXISTS idx_books_status ON books(status COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_books_title ON books(title COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_books_author ON books(author COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_books_completed
+        ON books(date_completed, date_started) WHERE date_completed != '';
+"""
+
+
+def configure(conn: sqlite3.Connection) -> None:
     """
-)
+    Apply the connection pragmas, switching the file to WAL only if it isn't
+    already, since that needs a write lock
+    """
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(PRAGMAS)
+
+
+@cache
+def get_conn() -> sqlite3.Connection:
+    """
+    Open and set up the database on first use, so commands that never touch it
+    (e.g. --help) skip the connect and schema setup
+    """
+    conn = sqlite3.connect(DB_PATH)
+    configure(conn)
+    conn.executescript(CREATE_DB)
+    conn.row_factory = sqlite3.Row
+    atexit.register(close_conn)
+    return conn
+
+
+def close_conn() -> None:
+    """
+    Checkpoint the WAL and close, registered with atexit so this also runs after
+    Ctrl-C or SIGTERM (see __main__)
+    """
+    conn = get_conn()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+@cache
+def get_cursor() -> sqlite3.Cursor:
+    return get_conn().cursor()
 
 
 class Status(StrEnum):
@@ -45,7 +92,10 @@ class Status(StrEnum):
     COMPLETED = "COMPLETED"
 
 
-@dataclass
+STATUSES = frozenset(Status)
+
+
+@dataclass(slots=True)
 class Book:
     id: int | None = None
     title: str = ""
@@ -56,108 +106,188 @@ class Book:
     days_to_read: int | None = None
 
     def __post_init__(self):
-        if self.status not in list(Status):
+        if self.status not in STATUSES:
             raise ValueError("status is invalid")
         if self.date_started and self.date_completed:
-            ds = datetime.strptime(self.date_started, "%Y-%m-%d")
-            dc = datetime.strptime(self.date_completed, "%Y-%m-%d")
+            ds = date.fromisoformat(self.date_started)
+            dc = date.fromisoformat(self.date_completed)
             self.days_to_read = (dc - ds).days + 1  # inclusive
         else:
             self.days_to_read = None
 
 
-def validate_dates(ctx, param, value):
-    if value == "":
-        return value
-    elif re.match("[0-9]{4}-[0-9]{2}-[0-9]{2}", value):
-        return value
-    else:
-        raise click.BadParameter("Dates must be formatted as 'YYYY-MM-DD'.")
+def is_iso_date(value: str) -> bool:
+    try:
+        # fromisoformat also accepts e.g. '20240101', so require the round trip
+        return date.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
 
 
-def get_books(
-    field: str | None = None, value: str | None = None
-) -> Optional[list[Book]]:
+def validate_dates(ctx, param, value):
+    if value == "" or is_iso_date(value):
+        return value
+    raise click.BadParameter("Dates must be formatted as 'YYYY-MM-DD'.")
+
+
+# days_to_read is computed by SQLite (NULL unless both dates are set), so rows
+# can be displayed without building a Book for each one
+SELECT_SQL = """
+    SELECT id, title, author, status, date_started, date_completed,
+        CAST(julianday(date_completed) - julianday(date_started) AS INTEGER) + 1
+        AS days_to_read
+    FROM books
+"""
+SEARCH_SQL = {"id": f"{SELECT_SQL} WHERE id=?"} | {
+    field: f"{SELECT_SQL} WHERE {field} LIKE ?"
+    for field in ("title", "author", "status", "date_started", "date_completed")
+}
+
+
+def get_rows(
+    field: str | None = None, value: str | None = None, prefix: bool = False
+) -> Iterator[sqlite3.Row]:
+    """
+    Return the cursor itself, so rows are fetched from SQLite as they are consumed
+    """
     if field and value:
+        if field not in SEARCH_SQL:
+            raise ValueError(f"{field} is not a searchable field")
+        read_sql = SEARCH_SQL[field]
         if field == "id":
-            read_sql = f"SELECT * FROM books WHERE id=?"
             binding = (value,)
+        elif prefix:
+            # No leading wildcard, so LIKE can use the NOCASE index
+            binding = (value + "%",)
         else:
-            read_sql = f"SELECT * FROM books WHERE {field} LIKE ?"
             binding = (str("%" + value + "%"),)
-        cursor = CONN.cursor()
-        books = cursor.execute(read_sql, binding).fetchall()
-    else:
-        cursor = CONN.cursor()
-        books = cursor.execute("SELECT * FROM books").fetchall()
+        return get_cursor().execute(read_sql, binding)
+    return get_cursor().execute(SELECT_SQL)
+
+
+def get_books(
+    field: str | None = None, value: str | None = None, prefix: bool = False
+) -> Optional[list[Book]]:
+    books = [Book(**row) for row in get_rows(field, value, prefix)]
     if books:
-        return [Book(**book) for book in books]
+        return books
     return None
 
 
+ADD_SQL = """
+    INSERT INTO books (title, author, status, date_started, date_completed)
+    VALUES (?, ?, ?, ?, ?);
+"""
+# Book -> ADD_SQL parameters, skipping id (assigned by SQLite) and days_to_read
+add_values = attrgetter("title", "author", "status", "date_started", "date_completed")
+
+
+def add_many(books: Iterable[Book], chunk_size: int = 500) -> int:
+    """
+    Insert books with executemany, in chunks, inside a single transaction
+    """
+    count = 0
+    with get_conn():
+        for chunk in batched(books, chunk_size):
+            get_cursor().executemany(
+                ADD_SQL, [add_values(book) for book in chunk]
+            )
+            count += len(chunk)
+    return count
+
+
+# rich column styles, in column order
+BOOK_COLORS = (
+    "white",
+    "bright_green",
+    "bright_blue",
+    "bright_red",
+    "bright_magenta",
+    "cyan3",
+    "orange1",
+)
+STATS_COLORS = ("bright_green", "bright_blue", "bright_red", "cyan3")
+
+
+def render_rows(
+    title: str,
+    columns: Iterable[str],
+    colors: Iterable[str],
+    rows: Iterable[Iterable],
+    **column_options,
+) -> None:
+    """
+    Print rows as a rich table, adding each row as it is consumed from rows
+    """
+    table = Table(title=title, box=box.ROUNDED)
+    for column, color in zip(columns, colors):
+        table.add_column(column, style=color, **column_options)
+    for row in rows:
+        table.add_row(*map(str, row))
+    console.print(table)
+
+
+# Per-month count and total days_to_read of finished books, aggregated by SQLite
+STATS_SQL = """
+    SELECT
+        CAST(substr(date_completed, 1, 4) AS INTEGER) AS year,
+        CAST(substr(date_completed, 6, 2) AS INTEGER) AS month,
+        COUNT(*) AS count,
+        SUM(
+            CAST(julianday(date_completed) - julianday(date_started) AS INTEGER) + 1
+        ) AS days
+    FROM books
+    WHERE date_completed != ''
+        AND julianday(date_completed) - julianday(date_started) IS NOT NULL
+        AND (:year IS NULL OR substr(date_completed, 1, 4) = printf('%04d', :year))
+    GROUP BY year, month
+"""
+
+
+def get_month_totals(year: int | None = None) -> list[sqlite3.Row]:
+    return get_cursor().execute(STATS_SQL, {"year": year}).fetchall()
+
+
 class BookStats:
     """
     Class to generate stats for books read, based on date_completed
     """
 
-    def __init__(self, books: list[Book]):
-        self.books = books
-        self.ymd = [self.get_ymd(book) for book in books]
-
-    def get_ymd(self, book: Book) -> Optional[tuple[int, int, int]]:
-        if book.days_to_read and book.date_completed:
-            ymd = datetime.fromisoformat(book.date_completed)
-            return (
-                ymd.year,
-                ymd.month,
-                book.days_to_read,
-            )
-        return None
+    def __init__(self, totals: Iterable[sqlite3.Row]):
+        # (count, total days_to_read) of books completed in each (year, month)
+        self.totals = {
+            (row["year"], row["month"]): (row["count"], row["days"]) for row in totals
+        }
 
-    def flatten(self, l: list) -> list:
-        out = []
-        for item in l:
-            if isinstance(item, list):
-                out.extend(self.flatten(item))
-            else:
-                out.append(item)
-        return out
+    def summarize(self, count: int, days: int) -> tuple[int, float | None]:
+        if count:
+            return count, round(days / count, 2)
+        return count, None
+
+    def month_row(self, year: int, month: int) -> dict:
+        totals = self.totals.get((year, month), (0, 0))
+        count, avg_days_to_read = self.summarize(*totals)
+        return {
+            "year": year,
+            "month": month,
+            "count": count,
+            "avg_days_to_read": avg_days_to_read,
+        }
 
     def complete_stats(self) -> list[dict]:
-        years = {book[0] for book in self.ymd if book}
-        stats = [
-            [self.month_stats(year, month) for month in range(1, 13)] for year in years
-        ]
-        return self.flatten(stats)
+        years = sorted({year for year, _ in self.totals})
+        return [self.month_row(year, month) for year in years for month in range(1, 13)]
 
     def month_stats(self, year: int, month: int) -> list[dict]:
-        books_read = [
-            book for book in self.ymd if book and book[0] == year and book[1] == month
-        ]
-        count = len(books_read)
-        if count:
-            avg_days_to_read = round(mean([book[2] for book in books_read]), 2)
-        else:
-            avg_days_to_read = None
-        return [
-            {
-                "year": year,
-                "month": month,
-                "count": count,
-                "avg_days_to_read": avg_days_to_read,
-            }
-        ]
+        return [self.month_row(year, month)]
 
     def year_stats(self, year: int, complete: bool = False) -> list[dict]:
-        books_read = [book for book in self.ymd if book and book[0] == year]
-        count = len(books_read)
-        if count:
-            avg_days_to_read = round(mean([book[2] for book in books_read]), 2)
-        else:
-            avg_days_to_read = None
         if complete:
-            month_stats = [self.month_stats(year, month) for month in range(1, 13)]
-            return self.flatten(month_stats)
+            return [self.month_row(year, month) for month in range(1, 13)]
+        months = [self.totals.get((year, month), (0, 0)) for month in range(1, 13)]
+        count, avg_days_to_read = self.summarize(
+            sum(count for count, _ in months), sum(days for _, days in months)
+        )
         return [
             {
                 "year": year,
@@ -167,15 +297,17 @@ class BookStats:
         ]
 
     def print_rich_table(self, stats: list[dict[str, int | float | None]]):
-        columns = stats[0].keys()
-        colors = ["bright_green", "bright_blue", "bright_red", "cyan3"]
-        table = Table(title="BookTracker Statistics", box=box.ROUNDED)
-        for column, color in zip(columns, colors):
-            table.add_column(column, style=color, justify="full", min_width=8)
-        for row in stats:
-            values = list(map(str, row.values()))
-            table.add_row(*values)
-        console.print(table)
+        if not stats:
+            print("There are no books to run stats on.")
+            return
+        render_rows(
+            "BookTracker Statistics",
+            stats[0].keys(),
+            STATS_COLORS,
+            (row.values() for row in stats),
+            justify="full",
+            min_width=8,
+        )
 
 
 @click.group()
@@ -216,79 +348,167 @@ def add(
         date_started=date_started,
         date_completed=date_completed,
     )
-    book_values = tuple(asdict(book).values())[0:-1]  # Remove days_to_read
-    add_sql = f"""
-        INSERT INTO books (id, title, author, status, date_started, date_completed)
-        VALUES (?, ?, ?, ?, ?, ?);
-    """
-    cursor = CONN.cursor()
-    cursor.execute(add_sql, book_values)
-    CONN.commit()
+    with get_conn():
+        book.id = get_cursor().execute(ADD_SQL, add_values(book)).lastrowid
     print(f"Added {book} to database")
 
 
+# BATCH ADD BOOKS
+def csv_books(rows: Iterable[dict[str, str]]) -> Iterator[Book]:
+    """
+    Check each csv row with the add options' status and date rules before
+    building its Book; a bad row raises click.BadParameter, which rolls back
+    add_many's transaction
+    """
+    for line, row in enumerate(rows, start=2):
+        status = row.get("status") or Status.TBR
+        date_started = row.get("date_started") or ""
+        date_completed = row.get("date_completed") or ""
+        try:
+            check_edit_value("status", status)
+            check_edit_value("date_started", date_started)
+            check_edit_value("date_completed", date_completed)
+        except ValueError as e:
+            raise click.BadParameter(f"line {line}: {e}", param_hint="--from-csv")
+        yield Book(
+            title=row.get("title") or "",
+            author=row.get("author") or "",
+            status=Status(status),
+            date_started=date_started,
+            date_completed=date_completed,
+        )
+
+
+@click.command("batch-add")
+@click.option(
+    "--from-csv",
+    "path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    required=True,
+    help="CSV with title, author, status, date_started, date_completed columns",
+)
+def batch_add(path: Path) -> None:
+    with open(path, newline="") as f:
+        count = add_many(csv_books(csv.DictReader(f)))
+    print(f"Added {count} books to database")
+
+
 # READ BOOKS
 @click.command()
 @click.option(
     "-f",
     "--field",
-    type=click.Choice(list(Book.__annotations__)),
+    type=click.Choice(list(SEARCH_SQL)),
     help="Field to search within",
 )
 @click.option("-v", "--value", help="Value to search for")
-def read(field: str | None = None, value: str | None = None) -> None:
+@click.option("-p", "--prefix", is_flag=True, help="Match values starting with --value")
+def read(
+    field: str | None = None, value: str | None = None, prefix: bool = False
+) -> None:
     if field and value:
-        books = get_books(field=field, value=value)
-        if not books:
-            print(f"There are no books with {field} containing {value}.")
+        books = get_rows(field=field, value=value, prefix=prefix)
+        match = "starting with" if prefix else "containing"
+        no_books = f"There are no books with {field} {match} {value}."
     else:
-        books = get_books()
-        if not books:
-            print("There are no books.")
-    if books:
-        columns = asdict(books[0]).keys()
-        colors = [
-            "white",
-            "bright_green",
-            "bright_blue",
-            "bright_red",
-            "bright_magenta",
-            "cyan3",
-            "orange1",
-        ]
-        rows = [map(str, asdict(book).values()) for book in books]
-        table = Table(title="BookTracker", box=box.ROUNDED)
-        for column, color in zip(columns, colors):
-            table.add_column(column, style=color)
-        for row in rows:
-            table.add_row(*row)
-        console.print(table)
+        books = get_rows()
+        no_books = "There are no books."
+    first = next(books, None)
+    if first is None:
+        print(no_books)
+    else:
+        render_rows("BookTracker", first.keys(), BOOK_COLORS, chain([first], books))
 
 
 # EDIT BOOK
+# Only these names, never user input, are interpolated into the UPDATE
+EDIT_FIELDS = tuple(f.name for f in fields(Book) if f.name != "days_to_read")
+
+
+def check_edit_value(column: str, value: str) -> str:
+    """
+    Apply the add options' status and date rules to an edited value, before
+    anything is written, so an edit can never store a row Book rejects
+    """
+    if column == "status" and value not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(Status)}")
+    date_column = column in ("date_started", "date_completed")
+    if date_column and value != "" and not is_iso_date(value):
+        raise ValueError(f"{column} must be formatted as 'YYYY-MM-DD'")
+    return value
+
+
+def edit_many(rows: Iterator[list[str]]) -> int:
+    """
+    Apply csv rows of edits (header 'id,<column>,...') with one prepared UPDATE
+    run through executemany, inside a single transaction
+    """
+    header = next(rows, None)
+    if not header:
+        return 0
+    columns = header[1:]
+    if header[0] != "id" or not columns or not set(columns) <= set(EDIT_FIELDS[1:]):
+        raise ValueError(f"header must be 'id' followed by any of {EDIT_FIELDS[1:]}")
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    update_sql = f"UPDATE books SET {assignments} WHERE id = ?"
+
+    def bindings() -> Iterator[tuple[str, ...]]:
+        # Raising mid-executemany rolls back every row already applied
+        for line, row in enumerate(rows, start=2):
+            if len(row) != len(header):
+                raise ValueError(
+                    f"line {line} has {len(row)} values, expected {len(header)}"
+                )
+            yield *map(check_edit_value, columns, row[1:]), row[0]
+
+    with get_conn():
+        cursor = get_cursor()
+        cursor.executemany(update_sql, bindings())
+    return cursor.rowcount
+
+
 @click.command()
-@click.argument("id")
-def edit(id: str) -> None:
+@click.argument("id", required=False)
+@click.option(
+    "--batch",
+    is_flag=True,
+    hidden=True,
+    help="Read csv edits (header 'id,<column>,...') from stdin",
+)
+def edit(id: str | None, batch: bool) -> None:
+    if batch:
+        try:
+            count = edit_many(csv.reader(sys.stdin))
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--batch")
+        print(f"Edited {count} books")
+        return
+    if id is None:
+        raise click.UsageError("Missing argument 'ID'.")
     books = get_books(field="id", value=id)
     if books:
-        book = asdict(books[0])
-        del book["days_to_read"]
+        book = books[0]
+        assignments = []
         update_values = []
-        update_sql = "SET "
-        for k, v in book.items():
-            data = input(f"Edit {k} ({v}): ")
+        for k in EDIT_FIELDS:
+            data = input(f"Edit {k} ({getattr(book, k)}): ")
             if data:
-                update_sql += f"{k} = ?, "
-                update_values.append(data)
+                try:
+                    update_values.append(check_edit_value(k, data))
+                except ValueError as e:
+                    raise click.BadParameter(str(e), param_hint=k)
+                assignments.append(f"{k} = ?")
         full_sql = f"""
         UPDATE books
-        {update_sql[0:-2]}
-        WHERE id = {id}
+        SET {", ".join(assignments)}
+        WHERE id = ?
+        RETURNING *
         """
         if update_values:
-            cursor = CONN.cursor()
-            cursor.execute(full_sql, update_values)
-            CONN.commit()
+            with get_conn():
+                cursor = get_cursor().execute(full_sql, (*update_values, id))
+                updated = cursor.fetchone()
+            print(f"Updated {', '.join(f'{k}={updated[k]!r}' for k in updated.keys())}")
     else:
         print(f"There is no book with {id=}")
 
@@ -305,10 +525,12 @@ def delete(id: str) -> None:
             == "y"
         )
         if to_delete:
-            delete_sql = f"DELETE FROM books WHERE id = {id}"
-            cursor = CONN.cursor()
-            cursor.execute(delete_sql)
-            CONN.commit()
+            with get_conn():
+                deleted = get_cursor().execute(
+                    "DELETE FROM books WHERE id = ? RETURNING title, author", (id,)
+                ).fetchone()
+            if deleted:
+                print(f"Deleted '{deleted['title']}' by {deleted['author']}")
     else:
         print(f"There is no book with {id=}")
 
@@ -318,19 +540,12 @@ def delete(id: str) -> None:
 @click.option("--complete", is_flag=True)
 @click.option("-y", "--year", type=int)
 @click.option("-m", "--month", type=click.IntRange(1, 12))
-@click.pass_context
 def stats(
-    ctx: click.Context,
     complete: bool | None = False,
     year: int | None = None,
     month: int | None = None,
 ) -> None:
-    books = get_books()
-    if books:
-        stats = BookStats(books)
-    else:
-        print("There are no books to run stats on.")
-        ctx.close()
+    stats = BookStats(get_month_totals(year))
     if not any([complete, year, month]):
         print("Choose --complete, --year, and/or --month to print stats.")
     if year and not month:
@@ -348,9 +563,10 @@ def stats(
 
 if __name__ == "__main__":
     cli.add_command(add)
+    cli.add_command(batch_add)
     cli.add_command(read)
     cli.add_command(edit)
     cli.add_command(delete)
     cli.add_command(stats)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     cli()
-    CONN.close()
@@ -0,0 +1,128 @@
+from click.testing import CliRunner
+import pytest
+
+from .. import main
+
+CSV_HEADER = "title,author,status,date_started,date_completed\n"
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    # A fresh database per test; the cached connection would otherwise outlive it
+    monkeypatch.setattr(main, "DB_PATH", tmp_path / "books.db")
+    monkeypatch.setattr(main.atexit, "register", lambda func: func)
+    main.get_conn.cache_clear()
+    main.get_cursor.cache_clear()
+    yield main.get_conn()
+    main.get_conn().close()
+    main.get_conn.cache_clear()
+    main.get_cursor.cache_clear()
+
+
+def titles(conn) -> list[str]:
+    return [row["title"] for row in conn.execute("SELECT title FROM books")]
+
+
+def test_batch_add(conn, tmp_path):
+    path = tmp_path / "books.csv"
+    path.write_text(
+        CSV_HEADER + "Dune,Herbert,COMPLETED,2024-01-01,2024-01-10\nEmma,,,,\n"
+    )
+    result = CliRunner().invoke(main.batch_add, ["--from-csv", str(path)])
+    assert result.exit_code == 0
+    assert titles(conn) == ["Dune", "Emma"]
+    assert conn.execute("SELECT status FROM books WHERE id = 2").fetchone()[0] == "TBR"
+
+
+@pytest.mark.parametrize(
+    "bad_row",
+    [
+        "Emma,Austen,done,,\n",
+        "Emma,Austen,COMPLETED,2024-02-01,2024-02-30\n",
+        "Emma,Austen,TBR,01/02/2024,\n",
+    ],
+)
+def test_batch_add_rejects_bad_row(conn, tmp_path, bad_row):
+    path = tmp_path / "books.csv"
+    path.write_text(CSV_HEADER + "Dune,Herbert,TBR,,\n" + bad_row)
+    result = CliRunner().invoke(main.batch_add, ["--from-csv", str(path)])
+    assert result.exit_code == 2
+    assert "Invalid value for --from-csv: line 3" in result.output
+    assert titles(conn) == []
+
+
+def add_book(title: str = "Dune", status: str = "TBR") -> None:
+    result = CliRunner().invoke(main.add, ["-t", title, "-a", "Herbert", "-s", status])
+    assert result.exit_code == 0
+
+
+def book_row(conn, id: int = 1) -> tuple:
+    return tuple(conn.execute("SELECT * FROM books WHERE id = ?", (id,)).fetchone())
+
+
+def test_edit(conn):
+    add_book()
+    # Prompts run id, title, author, status, date_started, date_completed
+    result = CliRunner().invoke(main.edit, ["1"], input="\nDuna\n\nIN_PROGRESS\n\n\n")
+    assert result.exit_code == 0
+    assert book_row(conn)[1:4] == ("Duna", "Herbert", "IN_PROGRESS")
+
+
+@pytest.mark.parametrize(
+    "edit_input,param",
+    [
+        ("\nDuna\n\ndone\n\n\n", "status"),
+        ("\nDuna\n\n\n2024-13-01\n\n", "date_started"),
+        ("\nDuna\n\n\n\n20240101\n", "date_completed"),
+    ],
+)
+def test_edit_rejects_bad_value(conn, edit_input, param):
+    add_book()
+    before = book_row(conn)
+    result = CliRunner().invoke(main.edit, ["1"], input=edit_input)
+    assert result.exit_code == 2
+    assert f"Invalid value for {param}" in result.output
+    assert book_row(conn) == before
+
+
+def test_edit_batch(conn):
+    add_book()
+    add_book("Emma")
+    edits = "id,title,status\n1,Duna,IN_PROGRESS\n2,Emma!,COMPLETED\n"
+    result = CliRunner().invoke(main.edit, ["--batch"], input=edits)
+    assert result.exit_code == 0
+    assert "Edited 2 books" in result.output
+    assert titles(conn) == ["Duna", "Emma!"]
+
+
+@pytest.mark.parametrize(
+    "edits",
+    [
+        "id,status\n1,done\n",
+        "id,date_completed\n1,2024-02-30\n",
+        "id,title,status\n1,Duna\n",
+        "id,days_to_read\n1,3\n",
+        # The bad second row rolls back the first
+        "id,title,status\n1,Duna,TBR\n1,Emma,bad\n",
+    ],
+)
+def test_edit_batch_rejects_bad_rows(conn, edits):
+    add_book()
+    before = book_row(conn)
+    result = CliRunner().invoke(main.edit, ["--batch"], input=edits)
+    assert result.exit_code == 2
+    assert "Invalid value for --batch" in result.output
+    assert book_row(conn) == before
+
+
+def test_read_prefix(conn):
+    for title in ("Dune", "Children of Dune", "Duneland"):
+        add_book(title)
+    result = CliRunner().invoke(main.read, ["-f", "title", "-v", "dune", "--prefix"])
+    assert result.exit_code == 0
+    assert "Duneland" in result.output
+    assert "Children" not in result.output
+    result = CliRunner().invoke(main.read, ["-f", "title", "-v", "dune"])
+    assert "Children" in result.output
+    result = CliRunner().invoke(main.read, ["-f", "title", "-v", "of", "-p"])
+    assert "There are no books with title starting with of." in result.output
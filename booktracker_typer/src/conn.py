@@ -1,3 +1,4 @@
+import atexit
 from pathlib import Path
 import sqlite3
 
@@ -10,19 +11,39 @@ CREATE TABLE IF NOT EXISTS books(
     status TEXT,
     date_started TEXT,
     date_completed TEXT
-)
+);
+CREATE INDEX IF NOT EXISTS idx_books_status ON books(status COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_books_title ON books(title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_books_author ON books(author COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_books_completed
+    ON books(date_completed, date_started) WHERE date_completed != '';
+"""
+# ALTER TABLE can only add VIRTUAL generated columns; it is computed from the
+# dates on read, so it needs no backfill and idx_books_completed still covers it
+ADD_DAYS_TO_READ = """
+ALTER TABLE books ADD COLUMN days_to_read INTEGER GENERATED ALWAYS AS (
+    CAST(julianday(date_completed) - julianday(date_started) AS INTEGER) + 1
+) VIRTUAL
+"""
+# WAL and synchronous=NORMAL make each commit a WAL append rather than a full
+# fsync of the database file
+PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-65536;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
 """
 
 
-def dict_factory(cursor, row):
-    columns = [column[0] for column in cursor.description]
-    return {k: v for k, v in zip(columns, row)}
-
-
-if not Path(DB_PATH).is_file():
-    CONN = sqlite3.connect(DB_PATH)
-    CONN.execute(CREATE_DB)
-    CONN.close()
-
+# Every statement in CREATE_DB is IF NOT EXISTS, so run it on each start; that
+# also adds new indexes to existing databases
 CONN = sqlite3.connect(DB_PATH)
-CONN.row_factory = dict_factory
+CONN.executescript(PRAGMAS)
+CONN.executescript(CREATE_DB)
+if "days_to_read" not in {col[1] for col in CONN.execute("PRAGMA table_xinfo(books)")}:
+    CONN.execute(ADD_DAYS_TO_READ)
+# sqlite3.Row is built in C and indexes by name, without a dict per row
+CONN.row_factory = sqlite3.Row
+# Closed at exit rather than after app(), so Ctrl-C and SIGTERM still close it
+atexit.register(CONN.close)
@@ -1,6 +1,5 @@
-from datetime import datetime
-import re
-from typing import Optional
+from datetime import date
+from typing import Iterable, Optional
 from typing_extensions import Self
 
 from pydantic import (
@@ -10,6 +9,19 @@ from pydantic import (
     model_validator,
 )
 
+from conn import CONN
+
+
+def is_iso_date(value: str) -> bool:
+    """
+    True for a real 'YYYY-MM-DD' date, checked by the C date parser; the round
+    trip rejects the other forms fromisoformat accepts, e.g. '20240101'
+    """
+    try:
+        return date.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
+
 
 class Book(BaseModel, extra="allow"):
     id: Optional[int] = None
@@ -23,7 +35,7 @@ class Book(BaseModel, extra="allow"):
     @classmethod
     def validate_date(cls, value: str) -> str:
         if value:
-            if re.match("[0-9]{4}-[0-9]{2}-[0-9]{2}", value):
+            if is_iso_date(value):
                 return value
             else:
                 raise ValueError("dates must be formatted as 'YYYY-MM-DD'.")
@@ -32,7 +44,7 @@ class Book(BaseModel, extra="allow"):
     @model_validator(mode="after")
     def validate_date_completed(self) -> Self:
         if self.date_started and self.date_completed:
-            if datetime.fromisoformat(self.date_completed) >= datetime.fromisoformat(
+            if date.fromisoformat(self.date_completed) >= date.fromisoformat(
                 self.date_started
             ):
                 return self
@@ -44,7 +56,22 @@ class Book(BaseModel, extra="allow"):
     @property
     def days_to_read(self) -> int | None:
         if self.date_started and self.date_completed:
-            ds = datetime.strptime(self.date_started, "%Y-%m-%d")
-            dc = datetime.strptime(self.date_completed, "%Y-%m-%d")
+            ds = date.fromisoformat(self.date_started)
+            dc = date.fromisoformat(self.date_completed)
             return (dc - ds).days + 1
         return None
+
+
+ADD_SQL = """
+    INSERT INTO books(title, author, status, date_started, date_completed)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def insert_books(rows: Iterable[tuple[str, str, str, str, str]]) -> int:
+    """
+    Insert (title, author, status, date_started, date_completed) rows with one
+    executemany, committed as a single transaction; returns the number inserted
+    """
+    with CONN:
+        return CONN.executemany(ADD_SQL, rows).rowcount
@@ -1,20 +1,55 @@
-from datetime import datetime
-import re
-from statistics import mean
-from typing import Optional
+from collections import defaultdict
+import csv
+from enum import StrEnum
+from itertools import chain
+from pathlib import Path
+import signal
+import sqlite3
+import sys
+from typing import Iterable, Iterator, Optional
 from typing_extensions import Annotated
 
 from pydantic import ValidationError
-from rich import box, print
-from rich.console import Console
-from rich.table import Table
+from rich import print
 import typer
 
 from conn import CONN
-from db import Book
+from db import Book, insert_books, is_iso_date
 
 app = typer.Typer()
-console = Console()
+
+# Table columns, in the order SELECT_SQL returns them
+BOOK_FIELDS = (*Book.model_fields, *Book.model_computed_fields)
+
+
+# rich column styles, in column order
+BOOK_COLORS = (
+    "white",
+    "bright_green",
+    "bright_blue",
+    "bright_red",
+    "bright_magenta",
+    "cyan3",
+    "orange1",
+)
+STATS_COLORS = ("bright_green", "bright_blue", "bright_red", "cyan3")
+
+
+# Per-month count and total days_to_read of finished books, aggregated by SQLite
+STATS_SQL = """
+    SELECT
+        CAST(substr(date_completed, 1, 4) AS INTEGER) AS year,
+        CAST(substr(date_completed, 6, 2) AS INTEGER) AS month,
+        COUNT(*) AS count,
+        SUM(days_to_read) AS days
+    FROM books
+    WHERE date_completed != '' AND days_to_read IS NOT NULL
+    GROUP BY year, month
+"""
+
+
+def get_month_totals() -> list[sqlite3.Row]:
+    return CONN.execute(STATS_SQL).fetchall()
 
 
 class BookStats:
@@ -22,64 +57,38 @@ class BookStats:
     Class to generate stats for books read, based on date_completed
     """
 
-    def __init__(self, books: list[Book]):
-        self.books = books
-        self.ymd = [self.get_ymd(book) for book in books]
-
-    def get_ymd(self, book: Book) -> Optional[tuple[int, int, int]]:
-        if book.days_to_read and book.date_completed:
-            ymd = datetime.fromisoformat(book.date_completed)
-            return (
-                ymd.year,
-                ymd.month,
-                book.days_to_read,
-            )
-        return None
-
-    def flatten(self, l: list) -> list:
-        out = []
-        for item in l:
-            if isinstance(item, list):
-                out.extend(self.flatten(item))
-            else:
-                out.append(item)
-        return out
+    def __init__(self, totals: list[sqlite3.Row]):
+        # [count, total days_to_read] of completed books per (year, month) and per
+        # year; SQLite does the per-book work, this only sums months into years
+        self.month_totals: dict[tuple[int, int], list[int]] = {}
+        self.year_totals: defaultdict[int, list[int]] = defaultdict(lambda: [0, 0])
+        for row in totals:
+            self.month_totals[(row["year"], row["month"])] = [row["count"], row["days"]]
+            year_totals = self.year_totals[row["year"]]
+            year_totals[0] += row["count"]
+            year_totals[1] += row["days"]
 
     def complete_stats(self) -> list[dict]:
-        years = {book[0] for book in self.ymd if book}
-        stats = [
-            [self.month_stats(year, month) for month in range(1, 13)] for year in years
-        ]
-        return self.flatten(stats)
-
-    def month_stats(self, year: int, month: int) -> list[dict]:
-        books_read = [
-            book for book in self.ymd if book and book[0] == year and book[1] == month
-        ]
-        count = len(books_read)
-        if count:
-            avg_days_to_read = round(mean([book[2] for book in books_read]), 2)
-        else:
-            avg_days_to_read = None
+        years = sorted(self.year_totals)
         return [
-            {
-                "year": year,
-                "month": month,
-                "count": count,
-                "avg_days_to_read": avg_days_to_read,
-            }
+            self.month_stats(year, month) for year in years for month in range(1, 13)
         ]
 
+    def month_stats(self, year: int, month: int) -> dict:
+        count, days = self.month_totals.get((year, month), (0, 0))
+        avg_days_to_read = round(days / count, 2) if count else None
+        return {
+            "year": year,
+            "month": month,
+            "count": count,
+            "avg_days_to_read": avg_days_to_read,
+        }
+
     def year_stats(self, year: int, complete: bool = False) -> list[dict]:
-        books_read = [book for book in self.ymd if book and book[0] == year]
-        count = len(books_read)
-        if count:
-            avg_days_to_read = round(mean([book[2] for book in books_read]), 2)
-        else:
-            avg_days_to_read = None
         if complete:
-            month_stats = [self.month_stats(year, month) for month in range(1, 13)]
-            return self.flatten(month_stats)
+            return [self.month_stats(year, month) for month in range(1, 13)]
+        count, days = self.year_totals.get(year, (0, 0))
+        avg_days_to_read = round(days / count, 2) if count else None
         return [
             {
                 "year": year,
@@ -89,39 +98,90 @@ class BookStats:
         ]
 
     def print_rich_table(self, stats: list[dict[str, int | float | None]]):
+        if not stats:
+            print("There are no books to run stats on.")
+            return
+        from rich import box
+        from rich.table import Table
+
         columns = stats[0].keys()
-        colors = ["bright_green", "bright_blue", "bright_red", "cyan3"]
         table = Table(title="BookTracker Statistics", box=box.ROUNDED)
-        for column, color in zip(columns, colors):
+        for column, color in zip(columns, STATS_COLORS):
             table.add_column(column, style=color, justify="full", min_width=8)
         for row in stats:
             values = list(map(str, row.values()))
             table.add_row(*values)
-        console.print(table)
+        print(table)
+
+
+# days_to_read is a generated column (NULL unless both dates are set), so rows
+# can be displayed without validating a pydantic Book for each one
+SELECT_SQL = f"SELECT {', '.join(BOOK_FIELDS)} FROM books"
+# Every read is paged; LIMIT -1 means no limit
+PAGE_SQL = "LIMIT ? OFFSET ?"
+READ_SQL = f"{SELECT_SQL} {PAGE_SQL}"
+# One fixed statement per searchable field; field names never reach the SQL
+SEARCH_SQL = {"id": f"{SELECT_SQL} WHERE id=? {PAGE_SQL}"} | {
+    field: f"{SELECT_SQL} WHERE {field} LIKE ? {PAGE_SQL}"
+    for field in Book.model_fields
+    if field != "id"
+}
+# Whole-value matches; NOCASE, like LIKE, so the NOCASE indexes still apply
+EXACT_SQL = {
+    field: f"{SELECT_SQL} WHERE {field} = ? COLLATE NOCASE {PAGE_SQL}"
+    for field in SEARCH_SQL
+    if field != "id"
+}
 
 
 def get_books(
-    field: str | None = None, value: str | None = None
-) -> Optional[list[Book]]:
+    field: str | None = None,
+    value: str | None = None,
+    prefix: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+    exact: bool = False,
+) -> Iterator[sqlite3.Row]:
+    """
+    Return the cursor itself, so rows are fetched from SQLite as they are consumed
+    """
+    page = (-1 if limit is None else limit, offset)
     if field and value:
+        if field not in SEARCH_SQL:
+            raise ValueError(f"{field} is not a searchable field")
+        read_sql = SEARCH_SQL[field]
         if field == "id":
-            read_sql = f"SELECT * FROM books WHERE id=?"
             binding = (value,)
+        elif exact:
+            read_sql = EXACT_SQL[field]
+            binding = (value,)
+        elif prefix:
+            # No leading wildcard, so LIKE can use the NOCASE index
+            binding = (value + "%",)
         else:
-            read_sql = f"SELECT * FROM books WHERE {field} LIKE ?"
-            binding = (str("%" + value + "%"),)
-        cursor = CONN.cursor()
-        books = cursor.execute(read_sql, binding).fetchall()
-    else:
-        cursor = CONN.cursor()
-        books = cursor.execute("SELECT * FROM books").fetchall()
-    if books:
-        return [Book(**book) for book in books]
-    return None
+            binding = (f"%{value}%",)
+        return CONN.execute(read_sql, (*binding, *page))
+    return CONN.execute(READ_SQL, page)
+
+
+def field_callback(value: Optional[str]):
+    if value is not None and value not in SEARCH_SQL:
+        raise typer.BadParameter(f"field must be one of {', '.join(SEARCH_SQL)}")
+    return value
+
+
+class Status(StrEnum):
+    TBR = "TBR"
+    IN_PROGRESS = "IN_PROGRESS"
+    COMPLETED = "COMPLETED"
+
+
+# Options typed as Status are checked by click's Choice; csv rows use the callback
+STATUSES = frozenset(Status)
 
 
 def status_callback(value: str):
-    if value not in ["TBR", "IN_PROGRESS", "COMPLETED"]:
+    if value not in STATUSES:
         raise typer.BadParameter(
             "status must be one of 'TBR', 'IN_PROGRESS', or 'COMPLETED'"
         )
@@ -129,7 +189,7 @@ def status_callback(value: str):
 
 
 def date_callback(value: str):
-    if not re.match("[0-9]{4}-[0-9]{2}-[0-9]{2}", value):
+    if value and not is_iso_date(value):
         raise typer.BadParameter("date columns must be formatted 'YYYY-MM-DD'")
     return value
 
@@ -138,31 +198,41 @@ def date_callback(value: str):
 def read(
     field: Annotated[
         Optional[str],
-        typer.Option("-f", "--field", help="Model field to search (e.g. id or title)"),
+        typer.Option(
+            "-f",
+            "--field",
+            callback=field_callback,
+            help="Model field to search (e.g. id or title)",
+        ),
     ] = None,
     value: Annotated[
         Optional[str], typer.Option("-v", "--value", help="Search term")
     ] = None,
+    prefix: Annotated[
+        bool,
+        typer.Option("-p", "--prefix", help="Match values starting with --value"),
+    ] = False,
+    limit: Annotated[
+        Optional[int], typer.Option(min=0, help="Show at most this many books")
+    ] = None,
+    offset: Annotated[int, typer.Option(min=0, help="Skip this many books")] = 0,
+    exact: Annotated[
+        bool,
+        typer.Option("-e", "--exact", help="Match values equal to --value"),
+    ] = False,
 ) -> None:
-    books = get_books(field, value)
-    if books:
-        columns = [*Book.model_fields.keys(), *Book.model_computed_fields.keys()]
-        colors = [
-            "white",
-            "bright_green",
-            "bright_blue",
-            "bright_red",
-            "bright_magenta",
-            "cyan3",
-            "orange1",
-        ]
-        rows = [map(str, book.model_dump().values()) for book in books]
+    books = get_books(field, value, prefix, limit, offset, exact)
+    first = next(books, None)
+    if first is not None:
+        from rich import box
+        from rich.table import Table
+
         table = Table(title="BookTracker", box=box.ROUNDED)
-        for column, color in zip(columns, colors):
+        for column, color in zip(BOOK_FIELDS, BOOK_COLORS):
             table.add_column(column, style=color)
-        for row in rows:
-            table.add_row(*row)
-        console.print(table)
+        for book in chain((first,), books):
+            table.add_row(*map(str, book))
+        print(table)
 
 
 @app.command()
@@ -170,14 +240,8 @@ def add(
     title: Annotated[str, typer.Argument()],
     author: Annotated[str, typer.Argument()],
     status: Annotated[
-        str,
-        typer.Option(
-            "-s",
-            "--status",
-            callback=status_callback,
-            help="TBR, IN_PROGRESS, COMPLETED",
-        ),
-    ] = "TBR",
+        Status, typer.Option("-s", "--status", help="TBR, IN_PROGRESS, COMPLETED")
+    ] = Status.TBR,
     date_started: Annotated[
         str,
         typer.Option("-d", "--date-started", callback=date_callback, help="YYYY-MM-DD"),
@@ -190,26 +254,60 @@ def add(
     ] = "",
 ) -> None:
     try:
-        book = Book(
-            title=title,
-            author=author,
-            status=status,
-            date_started=date_started,
-            date_completed=date_completed,
+        Book.model_validate(
+            {
+                "title": title,
+                "author": author,
+                "status": status,
+                "date_started": date_started,
+                "date_completed": date_completed,
+            }
         )
     except ValidationError as e:
         print(e)
-    cur = CONN.cursor()
-    sql = "INSERT INTO books(title, author, status, date_started, date_completed) VALUES (?, ?, ?, ?, ?)"
-    binding = (title, author, status, date_started, date_completed)
-    cur.execute(sql, binding)
-    CONN.commit()
+        raise typer.Exit(1)
+    insert_books([(title, author, status, date_started, date_completed)])
+
+
+def csv_book_rows(rows: Iterable[dict]) -> Iterator[tuple[str, str, str, str, str]]:
+    """
+    Validate csv rows as Books and yield their ADD_SQL parameters one at a time,
+    so insert_books never holds the whole file
+    """
+    for row in rows:
+        status = status_callback(row.get("status") or "TBR")
+        book = Book.model_validate(row | {"status": status})
+        yield book.title, book.author, status, book.date_started, book.date_completed
+
+
+@app.command()
+def batch_add(
+    path: Annotated[
+        Path,
+        typer.Option(
+            "--from-csv",
+            exists=True,
+            dir_okay=False,
+            help="CSV with title, author, status, date_started, date_completed columns",
+        ),
+    ],
+) -> None:
+    with open(path, newline="") as f:
+        try:
+            count = insert_books(csv_book_rows(csv.DictReader(f)))
+        except ValidationError as e:
+            print(e)
+            raise typer.Exit(1)
+    print(f"Added {count} books to database")
+
+
+DELETE_SELECT_SQL = "SELECT title, author FROM books WHERE id=?"
+DELETE_SQL = "DELETE FROM books WHERE id=?"
 
 
 @app.command()
 def delete(id: Annotated[int, typer.Argument(help="ID to delete")]) -> None:
-    cur = CONN.cursor()
-    book = cur.execute("SELECT * FROM books WHERE id=?", (id,)).fetchone()
+    book = CONN.execute(DELETE_SELECT_SQL, (id,)).fetchone()
     if book:
         book_info = f"'{book['title']}' by {book['author']}"
         delete_book = (
@@ -220,33 +318,31 @@ def delete(id: Annotated[int, typer.Argument(help="ID to delete")]) -> None:
         )
         if delete_book:
             print(f"Deleting {book_info}...")
-            cur.execute("DELETE FROM books WHERE id=?", (id,))
-            CONN.commit()
+            with CONN:
+                CONN.execute(DELETE_SQL, (id,))
             print(f"{book_info} has been deleted.")
     else:
         print(f"There is no book with {id=}.")
 
 
+# A single UPDATE for every edit: a column given an empty value keeps its own
+EDIT_COLUMNS = ("id", "title", "author", "status", "date_started", "date_completed")
+EDIT_SQL = f"""
+    UPDATE books
+    SET {", ".join(f"{c} = COALESCE(NULLIF(?, ''), {c})" for c in EDIT_COLUMNS)}
+    WHERE id = ?
+"""
+EDIT_SELECT_SQL = f"SELECT {', '.join(EDIT_COLUMNS)} FROM books WHERE id=?"
+
+
 @app.command()
 def edit(id: Annotated[int, typer.Argument(help="ID of book to edit")]) -> None:
-    cur = CONN.cursor()
-    book = cur.execute("SELECT * FROM books WHERE id=?", (id,)).fetchone()
+    book = CONN.execute(EDIT_SELECT_SQL, (id,)).fetchone()
     if book:
-        update_sql = "SET "
-        update_values = []
-        for k, v in book.items():
-            data = input(f"Edit {k} ({v}): ")
-            if data:
-                update_sql += f"{k} = ?, "
-                update_values.append(data)
-        full_sql = f"""
-        UPDATE books
-        {update_sql[0:-2]}
-        WHERE id = {id}
-        """
-        if update_values:
-            cur.execute(full_sql, update_values)
-            CONN.commit()
+        update_values = [input(f"Edit {k} ({book[k]}): ") for k in EDIT_COLUMNS]
+        if any(update_values):
+            with CONN:
+                CONN.execute(EDIT_SQL, (*update_values, id))
     else:
         print(f"There is no book with {id=}")
 
@@ -264,9 +360,7 @@ def stats(
         Optional[bool], typer.Option(help="Print complete stats by month")
     ] = False,
 ) -> None:
-    books = get_books()
-    if books:
-        stats = BookStats(books)
+    stats = BookStats(get_month_totals())
     if not any([complete, year, month]):
         print("Choose --complete, --year, and/or --month to print stats.")
     if year and not month:
@@ -275,7 +369,7 @@ def stats(
         else:
             stats.print_rich_table(stats.year_stats(year=year))
     if year and month:
-        stats.print_rich_table(stats.month_stats(year=year, month=month))
+        stats.print_rich_table([stats.month_stats(year=year, month=month)])
     if month and not year:
         print("You must provide a year and a month.")
     if complete and not year:
@@ -283,5 +377,5 @@ def stats(
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     app()
-    CONN.close()